@@ -1,19 +1,37 @@
 import os
 import time
 import io
+import threading
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload, build_http
+from google_auth_httplib2 import AuthorizedHttp
 
 SERVICE_ACCOUNT_FILE = 'credentials.json'
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+# Google Workspace type -> (export MIME type, file extension)
+GOOGLE_EXPORT = {
+    'application/vnd.google-apps.document': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+    'application/vnd.google-apps.spreadsheet': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'application/vnd.google-apps.presentation': ('application/vnd.openxmlformats-officedocument.presentationml.presentation', '.pptx')
+}
+
 POLL_INTERVAL = 30
+BATCH_SIZE = 100
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+MAX_POLL_INTERVAL = 300
+IDLE_BACKOFF = 1.5
 DOWNLOAD_FOLDER = 'knowledge_base/drive'
-if not os.path.exists(DOWNLOAD_FOLDER):
-    os.makedirs(DOWNLOAD_FOLDER)
+STATE_DB = 'drive_state.db'
+
+os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
 creds = None
 if os.path.exists(SERVICE_ACCOUNT_FILE):
@@ -25,55 +43,125 @@ else:
 
 try:
     service = build('drive', 'v3', credentials=creds)
+    thread_local = threading.local()
+    download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+    db = sqlite3.connect(STATE_DB)
+    db.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)')
+    db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+    db.execute('CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY)')
+
+    def is_seen(file_id):
+        return db.execute('SELECT 1 FROM seen WHERE id = ?', (file_id,)).fetchone() is not None
+
+    def load_pending_ids():
+        return {row[0] for row in db.execute('SELECT id FROM pending')}
+
+    def mark_pending(file_id):
+        db.execute('INSERT OR IGNORE INTO pending (id) VALUES (?)', (file_id,))
+
+    def clear_pending(file_id):
+        db.execute('DELETE FROM pending WHERE id = ?', (file_id,))
+
+    def load_page_token():
+        row = db.execute("SELECT value FROM state WHERE key = 'page_token'").fetchone()
+        return row[0] if row else None
+
+    def save_page_token(page_token):
+        db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('page_token', ?)", (page_token,))
+
+    # googleapiclient services are not thread-safe, so each download worker gets its own
+    def get_thread_service():
+        if not hasattr(thread_local, 'service'):
+            thread_local.service = build('drive', 'v3', http=AuthorizedHttp(creds, http=build_http()))
+        return thread_local.service
 
-    def get_all_files():
-        all_files = []
+    def get_start_page_token():
+        response = service.changes().getStartPageToken().execute()
+        return response.get('startPageToken')
+
+    def seed_seen_files():
+        # First run only: treat everything already in the Drive as known, like the original full listing did
+        seeded = 0
         page_token = None
         
         while True:
             results = service.files().list(
                 pageSize=1000,
-                fields="nextPageToken, files(id, name, createdTime, mimeType, size)",
+                fields="nextPageToken, files(id)",
                 pageToken=page_token
             ).execute()
             
             files = results.get('files', [])
-            all_files.extend(files)
+            db.executemany('INSERT OR IGNORE INTO seen (id) VALUES (?)', ((file['id'],) for file in files))
+            seeded += len(files)
             
             page_token = results.get('nextPageToken')
             if not page_token:
-                break
-                
-        return all_files
+                return seeded
+
+    def get_changes(page_token):
+        changes = []
+        
+        while True:
+            results = service.changes().list(
+                pageToken=page_token,
+                pageSize=1000,
+                fields="nextPageToken, newStartPageToken, changes(changeType, fileId, removed)"
+            ).execute()
+            
+            changes.extend(results.get('changes', []))
+            
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+
+    def get_files_metadata(file_ids):
+        files = {}
+        failed_ids = set()
+        file_ids = list(file_ids)
+        
+        def on_metadata(request_id, response, exception):
+            if exception is None:
+                files[response['id']] = response
+                return
+            print(f"Error getting metadata for {request_id}: {exception}")
+            # A 404 means the file is gone or no longer shared; anything else is worth retrying
+            if not (isinstance(exception, HttpError) and exception.resp.status == 404):
+                failed_ids.add(request_id)
+        
+        for start in range(0, len(file_ids), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=on_metadata)
+            for file_id in file_ids[start:start + BATCH_SIZE]:
+                batch.add(
+                    service.files().get(fileId=file_id, fields="id, name, mimeType, createdTime, trashed"),
+                    request_id=file_id
+                )
+            batch.execute()
+        
+        return files, failed_ids
 
     def download_file(file_id, file_name, mime_type):
         try:
             print(f"Downloading: {file_name}")
+            service = get_thread_service()
             
             if mime_type.startswith('application/vnd.google-apps'):
-                export_formats = {
-                    'application/vnd.google-apps.document': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    'application/vnd.google-apps.spreadsheet': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    'application/vnd.google-apps.presentation': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-                }
-                
-                if mime_type in export_formats:
-                    request = service.files().export_media(fileId=file_id, mimeType=export_formats[mime_type])
-                    if mime_type == 'application/vnd.google-apps.document':
-                        file_name += '.docx'
-                    elif mime_type == 'application/vnd.google-apps.spreadsheet':
-                        file_name += '.xlsx'
-                    elif mime_type == 'application/vnd.google-apps.presentation':
-                        file_name += '.pptx'
-                else:
+                export_format = GOOGLE_EXPORT.get(mime_type)
+                if export_format is None:
                     print(f"Cannot download {file_name}: Unsupported Google Workspace file type")
                     return False
+                
+                export_mime, ext = export_format
+                request = service.files().export_media(fileId=file_id, mimeType=export_mime)
+                file_name += ext
             else:
                 request = service.files().get_media(fileId=file_id)
             
-            file_path = os.path.join(DOWNLOAD_FOLDER, file_name)
+            # Prefix with the Drive ID: names aren't unique and downloads run concurrently
+            file_path = os.path.join(DOWNLOAD_FOLDER, f"{file_id}_{file_name}")
             fh = io.FileIO(file_path, 'wb')
-            downloader = MediaIoBaseDownload(fh, request)
+            downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_SIZE)
             
             done = False
             while done is False:
@@ -94,42 +182,87 @@ try:
         print(f"Downloads will be saved to: {DOWNLOAD_FOLDER}")
         print("Press Ctrl+C to stop monitoring\n")
         
-        known_files = set()
-        try:
-            initial_files = get_all_files()
-            for file in initial_files:
-                known_files.add(file['id'])
-            print(f"Found {len(known_files)} existing files in Drive")
-        except Exception as e:
-            print(f"Error getting initial file list: {e}")
-            return
+        # Resume from the last saved position so files added while we were down still get picked up
+        page_token = load_page_token()
+        if page_token is None:
+            try:
+                # Take the token before listing so nothing created during the listing slips through
+                page_token = get_start_page_token()
+                print(f"Found {seed_seen_files()} existing files in Drive")
+            except Exception as e:
+                print(f"Error getting initial file list: {e}")
+                return
+            save_page_token(page_token)
+            db.commit()
         
+        interval = POLL_INTERVAL
         while True:
             try:
                 print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking for new files...")
                 
-                current_files = get_all_files()
-                current_file_ids = {file['id'] for file in current_files}
+                changes, next_page_token = get_changes(page_token)
+                # Files from earlier polls whose lookup or download failed are retried alongside the new changes
+                changed_ids = load_pending_ids()
+                for change in changes:
+                    file_id = change.get('fileId')
+                    # Shared-drive entries (changeType 'drive') carry no file to download
+                    if change.get('changeType', 'file') != 'file' or not file_id:
+                        continue
+                    if change.get('removed'):
+                        clear_pending(file_id)
+                        changed_ids.discard(file_id)
+                    elif not is_seen(file_id):
+                        changed_ids.add(file_id)
                 
-                new_file_ids = current_file_ids - known_files
+                files, failed_ids = get_files_metadata(changed_ids)
+                pending_files = {}
+                for file_id in changed_ids:
+                    file = files.get(file_id)
+                    if file_id in failed_ids:
+                        mark_pending(file_id)
+                    elif file is None or file.get('trashed'):
+                        clear_pending(file_id)
+                    elif file['mimeType'].startswith('application/vnd.google-apps') and file['mimeType'] not in GOOGLE_EXPORT:
+                        # Folders, forms and the like can never be downloaded, so don't keep retrying them
+                        db.execute('INSERT OR IGNORE INTO seen (id) VALUES (?)', (file_id,))
+                        clear_pending(file_id)
+                    else:
+                        pending_files[file_id] = file
                 
-                if new_file_ids:
-                    print(f"Found {len(new_file_ids)} new file(s)!")
+                if pending_files:
+                    print(f"Found {len(pending_files)} new file(s)!")
+                    
+                    for file in pending_files.values():
+                        print(f"\nNew file detected: {file['name']}")
+                        print(f"Created: {file.get('createdTime', 'Unknown')}")
+                        print(f"Type: {file.get('mimeType', 'Unknown')}")
                     
-                    for file in current_files:
-                        if file['id'] in new_file_ids:
-                            print(f"\nNew file detected: {file['name']}")
-                            print(f"Created: {file.get('createdTime', 'Unknown')}")
-                            print(f"Type: {file.get('mimeType', 'Unknown')}")
-                            
-                            success = download_file(file['id'], file['name'], file.get('mimeType', ''))
-                            if success:
-                                known_files.add(file['id'])
+                    futures = {
+                        download_executor.submit(download_file, file_id, file['name'], file.get('mimeType', '')): file_id
+                        for file_id, file in pending_files.items()
+                    }
+                    for future in as_completed(futures):
+                        file_id = futures[future]
+                        if future.result():
+                            db.execute('INSERT OR IGNORE INTO seen (id) VALUES (?)', (file_id,))
+                            clear_pending(file_id)
+                        else:
+                            mark_pending(file_id)
                 else:
                     print("No new files found")
                 
-                print(f"Waiting {POLL_INTERVAL} seconds before next check...")
-                time.sleep(POLL_INTERVAL)
+                page_token = next_page_token
+                save_page_token(page_token)
+                db.commit()
+                
+                # Back off while the Drive is quiet, snap back as soon as something changes
+                if changes:
+                    interval = POLL_INTERVAL
+                else:
+                    interval = min(interval * IDLE_BACKOFF, MAX_POLL_INTERVAL)
+                
+                print(f"Waiting {interval:.0f} seconds before next check...")
+                time.sleep(interval)
                 
             except KeyboardInterrupt:
                 print("\n\nMonitoring stopped by user")
@@ -142,7 +275,7 @@ try:
     print("Listing current files from Google Drive...")
     try:
         results = service.files().list(
-            pageSize=10, fields="nextPageToken, files(id, name, createdTime)").execute()
+            pageSize=10, fields="files(id, name, createdTime)").execute()
         
         items = results.get('files', [])
 
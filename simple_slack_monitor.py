@@ -1,12 +1,22 @@
 import os
 import json
+import orjson
+import re
 import time
 import threading
+import collections
+import functools
 import requests
+import shutil
+import sqlite3
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timezone
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
 
 def load_config():
     config_path = "config.json"
@@ -27,26 +37,60 @@ if not config:
 
 SLACK_BOT_TOKEN = config['slack']['bot_token']
 TARGET_CHANNELS = config['slack']['target_channel'] if isinstance(config['slack']['target_channel'], list) else [config['slack']['target_channel']]
-JSON_FILE = config['output']['json_file']
-LOGGING_FILE = "knowledge_base/slack/logging.json"
+# Events are appended as JSON Lines, so always write to a .jsonl sibling of the configured path
+# rather than appending lines to an existing single-document .json file
+JSON_FILE = os.path.splitext(config['output']['json_file'])[0] + '.jsonl'
+LOGGING_FILE = "knowledge_base/slack/logging.jsonl"
 POLL_INTERVAL = config['monitoring']['poll_interval']
 BOT_USER_ID = None
 
 DOWNLOAD_FOLDER = "knowledge_base/slack"
+STATE_DB = "slack_state.db"
 MAX_FILE_SIZE = 25 * 1024 * 1024
-SUPPORTED_EXTENSIONS = ['.txt', '.pdf', '.docx', '.json', '.md', '.csv', '.xlsx', '.pptx']
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_WORKERS = 8
+HISTORY_PAGE_SIZE = 200
+# Never cap below the configured interval, or idle backoff would poll faster
+MAX_POLL_INTERVAL = max(POLL_INTERVAL, 300)
+IDLE_BACKOFF = 1.5
+KEYWORDS = ['/aisave', 'save this', 'important', 'remember this', '@ai', '@bot']
+SUPPORTED_EXTENSIONS = frozenset({'.txt', '.pdf', '.docx', '.json', '.md', '.csv', '.xlsx', '.pptx'})
 
-if not os.path.exists(DOWNLOAD_FOLDER):
-    os.makedirs(DOWNLOAD_FOLDER)
+os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
 client = WebClient(token=SLACK_BOT_TOKEN)
+client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=3))
+
+UserInfo = collections.namedtuple('UserInfo', ['id', 'name', 'display_name'])
+
+session = requests.Session()
+session.headers.update({'Authorization': f'Bearer {SLACK_BOT_TOKEN}'})
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.3)))
 
 class SimpleSlackMonitor:
     def __init__(self):
         self.last_check_time = datetime.now(timezone.utc).timestamp()
         self.running = False
         self.thread = None
+        self._stop_event = threading.Event()
         self.bot_user_id = self.get_bot_user_id()
+        self.total_messages = self.count_logged_messages()
+        self._aisave_re = re.compile(re.escape('/aisave'), re.IGNORECASE)
+        self._kw_re = re.compile('|'.join(re.escape(kw) for kw in KEYWORDS), re.IGNORECASE)
+        self._pattern_re = re.compile(r'(?:todo|note|reminder):', re.IGNORECASE)
+        self._download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+        self._inflight_downloads = {}
+        self._inflight_lock = threading.Lock()
+        self._log_buf = collections.deque()
+        self._log_buf_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._logging_file = open(LOGGING_FILE, 'ab')
+        os.makedirs(os.path.dirname(JSON_FILE) or '.', exist_ok=True)
+        self._events_file = open(JSON_FILE, 'ab')
+        # Downloads run on worker threads, so the connection is shared and guarded by a lock
+        self._db = sqlite3.connect(STATE_DB, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS downloaded (file_id TEXT PRIMARY KEY, path TEXT, size INTEGER, name TEXT, mimetype TEXT, download_timestamp TEXT)')
+        self._db_lock = threading.Lock()
         
     def get_bot_user_id(self):
         try:
@@ -58,49 +102,48 @@ class SimpleSlackMonitor:
             print(f"  Error getting bot user ID: {e}")
             return None
         
-    def load_existing_data(self):
-        try:
-            if os.path.exists(JSON_FILE) and os.path.getsize(JSON_FILE) > 0:
-                with open(JSON_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Error loading existing data: {e}")
-        return {"events": [], "last_updated": None}
-    
-    def load_logging_data(self):
+    def count_logged_messages(self):
         try:
-            if os.path.exists(LOGGING_FILE) and os.path.getsize(LOGGING_FILE) > 0:
-                with open(LOGGING_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            with open(LOGGING_FILE, 'r', encoding='utf-8') as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"Error loading logging data: {e}")
-        return {"messages": [], "last_updated": None, "total_messages": 0}
+        return 0
     
     def save_to_logging(self, message_data):
+        with self._log_buf_lock:
+            self._log_buf.append(message_data)
+        return True
+    
+    def _flush_logs(self):
+        with self._log_buf_lock:
+            pending = list(self._log_buf)
+            self._log_buf.clear()
+        
+        if not pending:
+            return True
+        
         try:
-            existing_data = self.load_logging_data()
-            
-            existing_data["messages"].append(message_data)
-            existing_data["last_updated"] = datetime.now().isoformat()
-            existing_data["total_messages"] = len(existing_data["messages"])
-            
-            with open(LOGGING_FILE, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
+            payload = b''.join(orjson.dumps(message_data) + b'\n' for message_data in pending)
+            with self._write_lock:
+                self._logging_file.write(payload)
+                self._logging_file.flush()
             
+            self.total_messages += len(pending)
             return True
         except Exception as e:
             print(f"  Error saving to logging: {e}")
+            with self._log_buf_lock:
+                self._log_buf.extendleft(reversed(pending))
             return False
     
     def save_to_json(self, data):
         try:
-            existing_data = self.load_existing_data()
-            
-            existing_data["events"].append(data)
-            existing_data["last_updated"] = datetime.now().isoformat()
-            
-            with open(JSON_FILE, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
+            with self._write_lock:
+                self._events_file.write(orjson.dumps(data) + b'\n')
+                self._events_file.flush()
             
             print(f" Data saved to {JSON_FILE}")
             return True
@@ -108,15 +151,10 @@ class SimpleSlackMonitor:
             print(f"  Error saving to JSON: {e}")
             return False
     
-    def get_user_info(self, user_id):
-        try:
-            return {
-                'id': user_id,
-                'name': f'user_{user_id}',
-                'display_name': f'User {user_id}'
-            }
-        except Exception as e:
-            return {'id': user_id, 'name': 'Unknown', 'display_name': 'Unknown'}
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def get_user_info(user_id):
+        return UserInfo(user_id, f'user_{user_id}', f'User {user_id}')
     
     def download_file(self, file_info):
         try:
@@ -125,6 +163,12 @@ class SimpleSlackMonitor:
             file_size = file_info.get('size', 0)
             file_url = file_info.get('url_private_download') or file_info.get('url_private')
             mimetype = file_info.get('mimetype', '')
+            ext = os.path.splitext(file_name)[1].lower()
+            
+            cached_record = self.get_downloaded_record(file_id)
+            if cached_record and os.path.exists(cached_record['saved_path']):
+                print(f"⏭️ Already downloaded: {file_name} → {cached_record['saved_path']}")
+                return dict(cached_record, cached=True)
             
             print(f"🔄 Attempting to download: {file_name} ({file_size} bytes)")
             
@@ -132,8 +176,7 @@ class SimpleSlackMonitor:
                 print(f"  File {file_name} is too large ({file_size} bytes > {MAX_FILE_SIZE} bytes)")
                 return None
             
-            _, ext = os.path.splitext(file_name)
-            if ext.lower() not in SUPPORTED_EXTENSIONS:
+            if ext not in SUPPORTED_EXTENSIONS:
                 print(f"  File {file_name} has unsupported extension: {ext}")
                 return None
             
@@ -141,25 +184,30 @@ class SimpleSlackMonitor:
                 print(f"  No download URL available for {file_name}")
                 return None
             
-            headers = {'Authorization': f'Bearer {SLACK_BOT_TOKEN}'}
-            
             print(f"🌐 Downloading from: {file_url[:50]}...")
-            response = requests.get(file_url, headers=headers, stream=True, timeout=30)
+            response = session.get(file_url, stream=True, timeout=30)
             
             if response.status_code == 200:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                safe_filename = f"{timestamp}_{file_name}"
+                safe_filename = f"{timestamp}_{file_id}_{file_name}"
                 file_path = os.path.join(DOWNLOAD_FOLDER, safe_filename)
                 
-                with open(file_path, 'wb') as f:
-                    total_size = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        total_size += len(chunk)
+                try:
+                    with open(file_path, 'wb') as f:
+                        self._preallocate(f, file_size)
+                        response.raw.decode_content = True
+                        shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+                        total_size = f.tell()
+                        f.truncate()
+                except Exception:
+                    # Don't leave a preallocated, zero-padded partial file behind for the RAG watcher to index
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                    raise
                 
                 print(f"✅ Downloaded: {file_name} → {file_path} ({total_size} bytes)")
                 
-                return {
+                download_result = {
                     'original_name': file_name,
                     'saved_path': file_path,
                     'size': total_size,
@@ -167,6 +215,8 @@ class SimpleSlackMonitor:
                     'download_timestamp': datetime.now().isoformat(),
                     'file_id': file_id
                 }
+                self.record_download(download_result)
+                return download_result
             else:
                 print(f"  Failed to download {file_name}: HTTP {response.status_code}")
                 print(f"    Response: {response.text[:200]}...")
@@ -176,13 +226,75 @@ class SimpleSlackMonitor:
             print(f"  Error downloading file {file_name}: {e}")
             return None
     
-    def process_message_files(self, message):
+    def get_downloaded_record(self, file_id):
+        with self._db_lock:
+            row = self._db.execute(
+                'SELECT name, path, size, mimetype, download_timestamp FROM downloaded WHERE file_id = ?',
+                (file_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            'original_name': row[0],
+            'saved_path': row[1],
+            'size': row[2],
+            'mimetype': row[3],
+            'download_timestamp': row[4],
+            'file_id': file_id
+        }
+    
+    def record_download(self, download_result):
+        with self._db_lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO downloaded (file_id, path, size, name, mimetype, download_timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                (download_result['file_id'], download_result['saved_path'], download_result['size'],
+                 download_result['original_name'], download_result['mimetype'], download_result['download_timestamp'])
+            )
+            self._db.commit()
+    
+    def _preallocate(self, f, size):
+        # Reserve the whole file up front on Linux so the copy loop doesn't grow it extent by extent
+        if not size or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
+    
+    def submit_message_files(self, message):
+        # The same Slack file can be attached to several messages; share one in-flight download per file ID
+        file_downloads = []
+        new_downloads = []
+        with self._inflight_lock:
+            for file_info in message.get('files', []):
+                file_id = file_info.get('id')
+                future = self._inflight_downloads.get(file_id)
+                if future is None:
+                    future = self._download_executor.submit(self.download_file, file_info)
+                    self._inflight_downloads[file_id] = future
+                    new_downloads.append((file_id, future))
+                file_downloads.append((file_info, future))
+        
+        # Registered outside the lock: the callback runs inline if the download already finished
+        for file_id, future in new_downloads:
+            future.add_done_callback(lambda _, file_id=file_id: self._forget_download(file_id))
+        return file_downloads
+    
+    def _forget_download(self, file_id):
+        with self._inflight_lock:
+            self._inflight_downloads.pop(file_id, None)
+    
+    def process_message_files(self, file_downloads):
         downloaded_files = []
+        counted = set()
         
-        files = message.get('files', [])
-        for file_info in files:
-            download_result = self.download_file(file_info)
-            if download_result:
+        for file_info, future in file_downloads:
+            if id(future) in counted:
+                continue
+            counted.add(id(future))
+            download_result = future.result()
+            # Files skipped because an earlier run already saved them don't count as downloads
+            if download_result and not download_result.get('cached'):
                 downloaded_files.append({
                     'file_info': file_info,
                     'download_result': download_result
@@ -190,33 +302,58 @@ class SimpleSlackMonitor:
         
         return downloaded_files
     
-    def get_recent_messages(self, channel, since_timestamp):
-        try:
+    def _paginated_history(self, channel, oldest=None, latest=None, limit=None):
+        cursor = None
+        fetched = 0
+        while True:
+            page_size = HISTORY_PAGE_SIZE if limit is None else min(HISTORY_PAGE_SIZE, limit - fetched)
             response = client.conversations_history(
                 channel=channel,
-                oldest=since_timestamp,
-                limit=50
+                oldest=oldest,
+                latest=latest,
+                cursor=cursor,
+                limit=page_size
             )
-            return response.get('messages', [])
+            messages = response.get('messages', [])
+            fetched += len(messages)
+            yield from messages
+            
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor or (limit is not None and fetched >= limit):
+                return
+    
+    def get_recent_messages(self, channel, since_timestamp, until_timestamp=None):
+        try:
+            return [
+                message for message in self._paginated_history(channel, since_timestamp, until_timestamp)
+                if message.get('user') != self.bot_user_id
+            ]
         except SlackApiError as e:
             print(f"Error getting messages: {e}")
             return []
     
-    def log_all_recent_messages(self):
+    def fetch_recent_messages(self, since_timestamp, until_timestamp=None):
+        with ThreadPoolExecutor(max_workers=max(1, len(TARGET_CHANNELS))) as executor:
+            channel_messages = executor.map(
+                lambda channel: self.get_recent_messages(channel, since_timestamp, until_timestamp),
+                TARGET_CHANNELS
+            )
+            return dict(zip(TARGET_CHANNELS, channel_messages))
+    
+    def log_all_recent_messages(self, per_channel_msgs):
+        logged = 0
+        now_iso = datetime.now().isoformat()
         try:
-            for channel in TARGET_CHANNELS:
-                messages = self.get_recent_messages(channel, self.last_check_time)
+            for channel, messages in per_channel_msgs.items():
+                file_downloads = [self.submit_message_files(message) for message in messages]
                 
-                for message in messages:
-                    if message.get('user') == self.bot_user_id:
-                        continue
-                    
-                    downloaded_files = self.process_message_files(message)
+                for message, message_downloads in zip(messages, file_downloads):
+                    downloaded_files = self.process_message_files(message_downloads)
                     
                     message_data = {
                         # 'message_id': message.get('ts'),
                         # 'channel_id': channel,
-                        'timestamp': datetime.now().isoformat(),
+                        'timestamp': now_iso,
                         # 'original_timestamp': message.get('ts'),
                         'user_id': message.get('user'),
                         # 'user_info': self.get_user_info(message.get('user', '')),
@@ -245,14 +382,16 @@ class SimpleSlackMonitor:
                     
                     # Save to logging file
                     self.save_to_logging(message_data)
+                    logged += 1
                     
                     file_count = len(downloaded_files)
                     file_info = f" ( {file_count} files downloaded)" if file_count > 0 else ""
                     user_info = self.get_user_info(message.get('user', ''))
-                    print(f" [{channel}] Logged message from {user_info['display_name']}: {message_data['text_usethisforQueries'][:50]}...{file_info}")
+                    print(f" [{channel}] Logged message from {user_info.display_name}: {message_data['text_usethisforQueries'][:50]}...{file_info}")
                     
         except Exception as e:
             print(f"Error logging recent messages: {e}")
+        return logged
     
     def check_for_files_in_history(self, limit=50):
         try:
@@ -264,14 +403,10 @@ class SimpleSlackMonitor:
             for channel in TARGET_CHANNELS:
                 print(f" Checking channel: {channel}")
                 
-                response = client.conversations_history(
-                    channel=channel,
-                    limit=limit
-                )
-                messages = response.get('messages', [])
+                messages = list(self._paginated_history(channel, limit=limit))
                 
                 files_found = 0
-                files_downloaded = 0
+                file_downloads = []
                 
                 for message in messages:
                     if message.get('user') == self.bot_user_id:
@@ -282,8 +417,9 @@ class SimpleSlackMonitor:
                         files_found += len(files)
                         print(f" [{channel}] Found {len(files)} file(s) in message: {message.get('text', '')[:50]}...")
                         
-                        downloaded_files = self.process_message_files(message)
-                        files_downloaded += len(downloaded_files)
+                        file_downloads.extend(self.submit_message_files(message))
+                
+                files_downloaded = len(self.process_message_files(file_downloads))
                 
                 print(f" [{channel}] File check: {files_found} files found, {files_downloaded} downloaded")
                 total_files_found += files_found
@@ -296,21 +432,16 @@ class SimpleSlackMonitor:
             print(f"Error checking for files in history: {e}")
             return False
     
-    def check_bot_mentions_and_keywords(self):
+    def check_bot_mentions_and_keywords(self, per_channel_msgs):
+        triggered = 0
+        now_iso = datetime.now().isoformat()
         try:
-            for channel in TARGET_CHANNELS:
-                messages = self.get_recent_messages(channel, self.last_check_time)
-                
-                keywords = ['/aisave', 'save this', 'important', 'remember this', '@ai', '@bot']
-                
+            for channel, messages in per_channel_msgs.items():
                 for message in messages:
                     message_text = message.get('text', '')
                     message_user = message.get('user', '')
                     message_ts = message.get('ts', '')
                     
-                    if message_user == self.bot_user_id:
-                        continue
-                    
                     trigger_type = None
                     trigger_details = None
                     
@@ -320,25 +451,26 @@ class SimpleSlackMonitor:
                         trigger_details = "Direct bot mention"
                     
                     # 2. /aisave command (even without slash command setup)
-                    elif '/aisave' in message_text.lower():
+                    elif self._aisave_re.search(message_text):
                         trigger_type = "aisave_command"
                         trigger_details = "Manual /aisave command"
                     
                     # 3. Keyword triggers
-                    elif any(keyword.lower() in message_text.lower() for keyword in keywords):
+                    elif matches := self._kw_re.findall(message_text):
                         trigger_type = "keyword_trigger"
-                        matched_keywords = [kw for kw in keywords if kw.lower() in message_text.lower()]
+                        matched = {match.lower() for match in matches}
+                        matched_keywords = [kw for kw in KEYWORDS if kw in matched]
                         trigger_details = f"Keywords: {', '.join(matched_keywords)}"
                     
                     # 4. Messages with specific patterns
-                    elif any(pattern in message_text.lower() for pattern in ['todo:', 'note:', 'reminder:']):
+                    elif self._pattern_re.search(message_text):
                         trigger_type = "pattern_match"
                         trigger_details = "Contains todo/note/reminder pattern"
                     
                     if trigger_type:
                         event_data = {
                             'type': trigger_type,
-                            'timestamp': datetime.now().isoformat(),
+                            'timestamp': now_iso,
                             'trigger_details': trigger_details,
                             'message': {
                                 'text': message_text,
@@ -351,10 +483,12 @@ class SimpleSlackMonitor:
                         }
                         
                         self.save_to_json(event_data)
+                        triggered += 1
                         print(f" [{channel}] {trigger_type} detected: {message_text[:80]}...")
                         
         except Exception as e:
             print(f"Error checking messages: {e}")
+        return triggered
     
     def start_monitoring(self):
         if self.running:
@@ -362,14 +496,16 @@ class SimpleSlackMonitor:
             return
         
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self.thread.start()
         print(f" Started comprehensive Slack monitoring for channels: {', '.join(TARGET_CHANNELS)}")
         print(f" Bot User ID: {self.bot_user_id}")
-        print(f" Polling interval: {POLL_INTERVAL} seconds")
+        print(f" Polling interval: {POLL_INTERVAL} seconds (backing off to {MAX_POLL_INTERVAL} seconds when idle)")
+        print(f" Messages logged so far: {self.total_messages}")
         print(f" Downloads folder: {DOWNLOAD_FOLDER}")
         print(f" Max file size: {MAX_FILE_SIZE / (1024*1024):.1f} MB")
-        print(f" Supported extensions: {', '.join(SUPPORTED_EXTENSIONS)}")
+        print(f" Supported extensions: {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
         print(f" Comprehensive logging includes:")
         print(f"   - All message metadata and content")
         print(f"   - File downloads (txt, pdf, docx, json, etc.)")
@@ -384,27 +520,47 @@ class SimpleSlackMonitor:
     
     def stop_monitoring(self):
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join()
+        self._flush_logs()
+        with self._write_lock:
+            self._logging_file.close()
+            self._events_file.close()
+        with self._db_lock:
+            self._db.close()
         print("⏹️ Stopped monitoring")
     
     def _monitor_loop(self):
+        interval = POLL_INTERVAL
         while self.running:
             try:
                 print(f"🔍 [{datetime.now().strftime('%H:%M:%S')}] Checking for new messages...")
                 
-                self.log_all_recent_messages()
+                now = datetime.now(timezone.utc).timestamp()
+                # Bound the window at `now` so anything newer is left for the next poll instead of seen twice
+                per_channel_msgs = self.fetch_recent_messages(self.last_check_time, now)
+                
+                events_seen = self.log_all_recent_messages(per_channel_msgs)
+                
+                events_seen += self.check_bot_mentions_and_keywords(per_channel_msgs)
+                
+                self._flush_logs()
                 
-                self.check_bot_mentions_and_keywords()
+                self.last_check_time = now
                 
-                self.last_check_time = datetime.now(timezone.utc).timestamp()
+                # Back off while channels are quiet, snap back as soon as something arrives
+                if events_seen:
+                    interval = POLL_INTERVAL
+                else:
+                    interval = min(interval * IDLE_BACKOFF, MAX_POLL_INTERVAL)
                 
-                time.sleep(POLL_INTERVAL)
+                self._stop_event.wait(interval)
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 print(f"Error in monitoring loop: {e}")
-                time.sleep(POLL_INTERVAL)
+                self._stop_event.wait(POLL_INTERVAL)
 
 def main():
     print("🤖 Enhanced Slack Monitor Starting...")